@@ -1,18 +1,27 @@
-from typing import AsyncGenerator
+import asyncio
+from typing import AsyncGenerator, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 from app.core.database import AsyncSessionLocal
 from app.db.models import User
-from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+DEMO_USER_EMAIL = "demo@botconsulting.io"
 
-# Database Dependency
+# Resolved once, then served from memory — auth runs on every endpoint, so
+# we don't want a DB round trip per request just to fetch the same row.
+_demo_user: Optional[User] = None
+_demo_user_lock = asyncio.Lock()
+
+
+# Database Dependency.
+# One session per request: FastAPI caches this dependency's value within a
+# request, so every Depends(get_db) in the same request (routes, auth)
+# shares one session and one pool checkout. The context manager already
+# closes on exit — no explicit close() ceremony.
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
-        try:
-            yield session
-        finally:
-            await session.close()
+        yield session
 
 
 # Mock Auth Dependency for now
@@ -20,11 +29,23 @@ async def get_current_user(db: AsyncSession = Depends(get_db)) -> User:
     """
     Returns a demo user. In a real app, this would decode the JWT token.
     """
-    result = await db.execute(select(User).limit(1))
-    user = result.scalars().first()
-    if not user:
-        user = User(email="demo@botconsulting.io")
-        db.add(user)
+    global _demo_user
+    if _demo_user is not None:
+        return _demo_user
+
+    async with _demo_user_lock:
+        if _demo_user is not None:
+            return _demo_user
+
+        # Single round trip: INSERT ... ON CONFLICT DO UPDATE RETURNING
+        # replaces the old SELECT-then-INSERT-then-REFRESH dance.
+        stmt = pg_insert(User).values(email=DEMO_USER_EMAIL)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["email"], set_={"email": stmt.excluded.email}
+        ).returning(User)
+        result = await db.execute(stmt)
+        user = result.scalars().one()
         await db.commit()
-        await db.refresh(user)
-    return user
+
+        _demo_user = user
+        return user
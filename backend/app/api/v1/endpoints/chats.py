@@ -1,46 +1,80 @@
+import asyncio
+from datetime import datetime
 from typing import List, Any, Optional
-from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, status , Query
+from uuid import UUID, uuid4
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Response,
+    status,
+    Query,
+)
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.api import deps
+from app.core.database import AsyncSessionLocal
 from app.db.models import User, MessageRole, Document, Conversation, Message
 from app.schemas import chat as schemas
 from app.crud import chat as crud
-from app.llm_client import llm_client
 from app.services.socketio_manager import sio
 from app.services.rag_service import rag_service
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from app.services.llm_graph import app_graph
+from app.services.llm_graph import get_app_graph
 
 router = APIRouter()
 
+# Keyed dispatch: DB role -> LangChain message type. SYSTEM rows (absent from
+# the map) are skipped, same as the old if/elif chain.
+_ROLE_MAP = {
+    MessageRole.USER: HumanMessage,
+    MessageRole.ASSISTANT: AIMessage,
+}
+
 
 async def run_chat_graph(
     db: AsyncSession,
     chat: Conversation,
     user_content: str,
     doc_ids: Optional[List[str]] = None,
+    query_vector: Optional[List[float]] = None,
+    user_msg_data: Optional[dict] = None,
+    has_documents: bool = False,
 ) -> Message:
     """
     Executes the LangGraph workflow.
+
+    has_documents is the caller's verdict on the conversation's document
+    state (both endpoints have it in hand); the graph skips retrieval —
+    including the query embedding — when it is False and no vector was
+    pre-computed. The default covers conversation creation, where the
+    chat cannot have documents yet.
+
+    When user_msg_data is given (conversation creation), the user and AI
+    messages go out as one 'message_pair' event — a single Redis round
+    trip instead of two.
     """
     # 1. Prepare LangChain formatted messages (History)
-    # Sliding window: last 10
-    recent_msgs = chat.messages[-10:] if chat.messages else []
-    lc_messages = []
-    for m in recent_msgs:
-        if m.role == MessageRole.USER:
-            lc_messages.append(HumanMessage(content=m.content))
-        elif m.role == MessageRole.ASSISTANT:
-            lc_messages.append(AIMessage(content=m.content))
+    # Sliding window: last 10, sliced in SQL so we never ship full history
+    recent_msgs = await crud.chat.get_recent_messages(db, chat.id, limit=10)
+    lc_messages = [
+        _ROLE_MAP[m.role](content=m.content)
+        for m in recent_msgs
+        if m.role in _ROLE_MAP
+    ]
 
     # Add current user message if not already there
     if not lc_messages or lc_messages[-1].content != user_content:
         lc_messages.append(HumanMessage(content=user_content))
 
     # 2. Invoke Graph
+    # stream_id lets the frontend correlate incremental 'message_delta' events
+    # with the final persisted message.
+    stream_id = str(uuid4())
+    room_id = str(chat.id)
     print(f"🚀 Invoking LangGraph for Chat {chat.id}")
     inputs = {
         "messages": lc_messages,
@@ -48,11 +82,13 @@ async def run_chat_graph(
         "chat_id": chat.id,
         "db_session": db,  # Passing DB session into graph state
         "context": "",
-        "has_documents": False,
+        "has_documents": has_documents,
         "doc_ids": doc_ids,
+        "stream_id": stream_id,
+        "query_vector": query_vector,
     }
 
-    result = await app_graph.ainvoke(inputs)
+    result = await get_app_graph().ainvoke(inputs)
 
     # 3. Extract AI Response
     # The graph returns the updated state. The last message is the AI's response.
@@ -66,12 +102,23 @@ async def run_chat_graph(
         db, conversation_id=chat.id, obj_in=ai_msg_in, role=MessageRole.ASSISTANT
     )
 
-    # 5. Emit to Socket
-    await sio.emit_to_room(
-        room=str(chat.id),
-        event="new_message",
-        data=schemas.MessageResponse.model_validate(ai_msg).model_dump(mode="json"),
-    )
+    # 5. Emit final message to Socket
+    # Tokens were already streamed as 'message_delta'; this carries the
+    # persisted message (with real id) so clients can replace the draft.
+    ai_msg_data = schemas.MessageResponse.from_orm_fast(ai_msg).model_dump(mode="json")
+    ai_msg_data["stream_id"] = stream_id
+    if user_msg_data is not None:
+        await sio.emit_to_room(
+            room=room_id,
+            event="message_pair",
+            data={"user": user_msg_data, "assistant": ai_msg_data},
+        )
+    else:
+        await sio.emit_to_room(
+            room=room_id,
+            event="new_message",
+            data=ai_msg_data,
+        )
 
     return ai_msg
 
@@ -90,20 +137,22 @@ async def create_conversation(
         db=db, user_id=current_user.id, obj_in=chat_in
     )
 
-    # 2. [NEW] Trigger LLM immediately for the first message
-    # We emit the user message first so the UI updates nicely
+    # 2. Generate the AI reply, then emit both messages as one
+    # 'message_pair' event — the user-message emit used to be a second
+    # Redis round trip overlapped with the LLM run; batching halves the
+    # socket I/O for the same information.
+    user_msg_data = None
     if new_chat.messages:
-        first_msg = new_chat.messages[0]
-        await sio.emit_to_room(
-            room=str(new_chat.id),
-            event="new_message",
-            data=schemas.MessageResponse.model_validate(first_msg).model_dump(
-                mode="json"
-            ),
-        )
-
-    # 3. Generate AI Reply
-    await run_chat_graph(db, new_chat, chat_in.first_message, doc_ids=chat_in.doc_ids)
+        user_msg_data = schemas.MessageResponse.from_orm_fast(
+            new_chat.messages[0]
+        ).model_dump(mode="json")
+    await run_chat_graph(
+        db,
+        new_chat,
+        chat_in.first_message,
+        doc_ids=chat_in.doc_ids,
+        user_msg_data=user_msg_data,
+    )
 
     return new_chat
 
@@ -115,9 +164,15 @@ async def list_conversations(
     db: AsyncSession = Depends(deps.get_db),
     current_user: User = Depends(deps.get_current_user),
 ) -> Any:
-    return await crud.chat.get_multi_by_user(
+    summaries = await crud.chat.get_multi_by_user(
         db=db, user_id=current_user.id, skip=skip, limit=limit
     )
+    # One pass through the cached TypeAdapter rather than FastAPI
+    # re-validating each summary against the response_model (kept above
+    # for OpenAPI documentation).
+    return ORJSONResponse(
+        schemas.CONVERSATION_SUMMARIES.dump_python(summaries, mode="json")
+    )
 
 
 @router.get("/{chat_id}", response_model=schemas.ConversationDetail)
@@ -126,50 +181,107 @@ async def get_conversation(
     db: AsyncSession = Depends(deps.get_db),
     limit: int = Query(50, gt=0, le=100),  # Pagination: Default 50, Max 100
     skip: int = Query(0, ge=0),
+    # Keyset cursor: pass the created_at + id of the last message seen.
+    # Preferred over skip — OFFSET cost grows with conversation length.
+    after_created_at: Optional[datetime] = Query(None),
+    after_id: Optional[UUID] = Query(None),
 ) -> Any:
     """
     Get conversation details with paginated messages and unique document list.
     """
-    chat_details = await crud.chat.get_details(
-        db, conversation_id=chat_id, limit=limit, offset=skip
+    after = (
+        (after_created_at, after_id)
+        if after_created_at is not None and after_id is not None
+        else None
+    )
+    detail_json = await crud.chat.get_details(
+        db, conversation_id=chat_id, limit=limit, offset=skip, after=after
     )
 
-    if not chat_details:
+    if detail_json is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    return chat_details
+    # The payload is already the ConversationDetail JSON, built server-side
+    # in Postgres — pass it through without re-validating/re-serializing.
+    # response_model above still documents the shape in OpenAPI.
+    return Response(content=detail_json, media_type="application/json")
 
 
-@router.post("/{chat_id}/messages", response_model=schemas.MessageResponse)
+async def generate_ai_reply(
+    chat: Conversation,
+    user_content: str,
+    doc_ids: Optional[List[str]] = None,
+    query_vector: Optional[List[float]] = None,
+    has_documents: bool = False,
+) -> None:
+    """
+    Background task: runs the chat graph with its own session. The request
+    session is torn down before FastAPI background tasks execute, so we
+    cannot reuse it here.
+    """
+    async with AsyncSessionLocal() as session:
+        await run_chat_graph(
+            session,
+            chat,
+            user_content,
+            doc_ids=doc_ids,
+            query_vector=query_vector,
+            has_documents=has_documents,
+        )
+
+
+@router.post(
+    "/{chat_id}/messages", response_model=schemas.MessageQueued, status_code=202
+)
 async def send_message(
     chat_id: UUID,
     msg_in: schemas.MessageCreate,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(deps.get_db),
 ) -> Any:
-    # 1. Validate Chat
-    chat = await crud.chat.get_details(db, conversation_id=chat_id)
+    # 1. Validate Chat (single query: conversation + documents)
+    chat = await crud.chat.get_with_context(db, conversation_id=chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    # 2. Save & Emit User Message
-    user_msg = await crud.chat.create_message(
+    # 2. Save User Message & Embed Query Concurrently
+    # The embedding is a blocking network call that is independent of the DB
+    # write, so we overlap both instead of paying for them back-to-back.
+    # Only embed when the chat actually has documents to retrieve against.
+    # The user row is committed here: the background task uses a fresh
+    # session and must see it.
+    save_user = crud.chat.create_message(
         db, conversation_id=chat_id, obj_in=msg_in, role=MessageRole.USER
     )
+    if chat.documents:
+        user_msg, query_vector = await asyncio.gather(
+            save_user,
+            rag_service.embed_query_cached(msg_in.content),
+        )
+    else:
+        user_msg = await save_user
+        query_vector = None
 
     await sio.emit_to_room(
         room=str(chat_id),
         event="new_message",
-        data=schemas.MessageResponse.model_validate(user_msg).model_dump(mode="json"),
+        data=schemas.MessageResponse.from_orm_fast(user_msg).model_dump(mode="json"),
     )
 
-    # 3. Refresh chat context in memory
-    # We append the new message to the loaded object so the LLM sees it in history
-    chat.messages.append(user_msg)
-
-    # 4. Generate AI Reply using the helper
-    ai_msg = await run_chat_graph(db, chat, msg_in.content, doc_ids=msg_in.doc_ids)
+    # 3. Queue the AI reply and return immediately
+    # The HTTP client only needs the ack — the reply is delivered over the
+    # already-open socket, so there is no point holding the connection for
+    # the multi-second LLM call.
+    background_tasks.add_task(
+        generate_ai_reply,
+        chat,
+        msg_in.content,
+        doc_ids=msg_in.doc_ids,
+        query_vector=query_vector,
+        has_documents=bool(chat.documents),
+    )
 
-    return ai_msg
+    return schemas.MessageQueued(user_message_id=user_msg.id)
 
 
 @router.delete("/{chat_id}", status_code=204)
@@ -1,6 +1,7 @@
-import shutil
 import os
 from typing import Any, List
+
+import aiofiles
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -30,10 +31,11 @@ async def upload_document(
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
 
-    # 2. Save File Locally
+    # 2. Save File Locally (streamed in 1MB chunks, off the event loop)
     file_path = os.path.join(UPLOAD_DIR, f"{conversation_id}_{file.filename}")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    async with aiofiles.open(file_path, "wb") as buffer:
+        while chunk := await file.read(1 << 20):
+            await buffer.write(chunk)
 
     # 3. Create DB Entry
     doc_in = schemas.DocumentCreate(
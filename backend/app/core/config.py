@@ -1,4 +1,5 @@
 # File: app/core/config.py
+from functools import cached_property
 from typing import Optional
 from pydantic import PostgresDsn, computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -24,8 +25,30 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str
 
+    # Connection pool sizing. pool_size + max_overflow caps concurrent
+    # connections per worker; keep (workers * cap) below Postgres max_connections.
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    # Set False behind PgBouncer transaction pooling: the ping's SELECT 1
+    # leaves backends idle-in-transaction for no benefit.
+    DB_POOL_PRE_PING: bool = True
+    # Server-side cap for any single statement (seconds, asyncpg).
+    DB_COMMAND_TIMEOUT: int = 60
+    # SQL statement logging — opt-in only. Tied to DEBUG before, which
+    # meant every dev run paid the per-statement I/O tax.
+    SQLALCHEMY_ECHO: bool = False
+
+    # When set, connections go through PgBouncer which owns pooling —
+    # the app-side pool is disabled and asyncpg's statement cache turned off
+    # (prepared statements break under transaction-mode pooling).
+    PGBOUNCER_URL: Optional[str] = None
+
+    # cached_property: computed once, not re-derived on every engine or
+    # worker-task access.
     @computed_field
-    @property
+    @cached_property
     def ASYNC_DATABASE_URL(self) -> str:
         """
         Ensures we use the async driver (postgresql+asyncpg)
@@ -55,12 +78,18 @@ class Settings(BaseSettings):
 
     # LLM Settings
     LLM_PROVIDER: str = "groq"  # default to groq for speed/free
+    # Hard cap on a single LLM call so a stuck provider doesn't pin a
+    # connection slot forever.
+    LLM_TIMEOUT_S: float = 60.0
     OPENAI_API_KEY: Optional[str] = None
     GROQ_API_KEY: Optional[str] = None
 
     # RAG Settings
     EMBEDDING_MODEL: str = "text-embedding-3-small"
     VECTOR_DIMENSION: int = 1536
+    # HNSW search-time candidate list size. Higher = better recall, slower.
+    # Tune per deployment based on vector count.
+    HNSW_EF_SEARCH: int = 100
 
     LOG_LEVEL: str = "INFO"
 
@@ -1,16 +1,73 @@
 # File: app/core/database.py
-from typing import AsyncGenerator
+from pgvector.asyncpg import register_vector
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from app.core.config import settings
 
 # Create Async Engine
 # echo=True prints SQL queries to console (useful for dev, turn off in prod)
-engine = create_async_engine(
-    settings.ASYNC_DATABASE_URL,
-    echo=settings.DEBUG,
-    future=True,
-    pool_pre_ping=True,  # Handles dropped connections automatically
-)
+# TCP keepalives surface dead peers (LB idle timeouts, failovers) in seconds
+# instead of hanging until the kernel default gives up; command_timeout caps
+# any single statement server-side.
+_CONNECT_ARGS = {
+    "server_settings": {
+        "tcp_keepalives_idle": "30",
+        "tcp_keepalives_interval": "10",
+    },
+    "command_timeout": settings.DB_COMMAND_TIMEOUT,
+}
+
+if settings.PGBOUNCER_URL:
+    # PgBouncer owns pooling: no app-side pool, no asyncpg prepared-statement
+    # cache (breaks under transaction-mode pooling).
+    engine = create_async_engine(
+        settings.PGBOUNCER_URL.replace("postgresql://", "postgresql+asyncpg://", 1),
+        echo=settings.SQLALCHEMY_ECHO,
+        future=True,
+        query_cache_size=1200,
+        poolclass=NullPool,
+        connect_args={"statement_cache_size": 0, **_CONNECT_ARGS},
+    )
+else:
+    engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL,
+        echo=settings.SQLALCHEMY_ECHO,
+        future=True,
+        # Compiled-statement cache sized for the hot endpoints; defaults
+        # (500) can thrash once per-entity variants pile up.
+        query_cache_size=1200,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        # Env-driven: disable behind PgBouncer-style proxies where the
+        # health-check SELECT 1 does more harm than good.
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        # Direct connections own their statements, so a deep asyncpg
+        # prepared-statement cache is safe (unlike the PgBouncer branch)
+        # and skips re-preparing the hot statements per connection.
+        connect_args={"statement_cache_size": 500, **_CONNECT_ARGS},
+    )
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _register_pgvector_codecs(dbapi_connection, connection_record):
+    """
+    Registers pgvector's binary codecs on every new asyncpg connection.
+    Embedding binds then go over the wire in binary instead of being
+    rendered as (and parsed back from) a 1536-element text literal.
+    """
+    try:
+        dbapi_connection.run_async(register_vector)
+    except ValueError:
+        # Fresh database: the vector extension doesn't exist yet, so the
+        # type lookup fails. The lifespan's CREATE EXTENSION runs over
+        # this very pool, so the first connection must still come up —
+        # it just falls back to pgvector's text protocol until the pool
+        # recycles it.
+        pass
+
 
 # Session Factory
 AsyncSessionLocal = async_sessionmaker(
@@ -18,13 +75,4 @@ AsyncSessionLocal = async_sessionmaker(
 )
 
 
-# Dependency for Routes
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with AsyncSessionLocal() as session:
-        try:
-            yield session
-        finally:
-            await session.close()
-
-
 # TODO: have to run this for the first time to enable extension,  CREATE EXTENSION IF NOT EXISTS vector;
\ No newline at end of file
@@ -1,122 +1,233 @@
-from typing import List, Optional, Any
+from datetime import datetime
+from typing import List, Optional, Any, Tuple
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc, func, update
-from sqlalchemy.orm import selectinload
+from sqlalchemy import (
+    select,
+    delete,
+    desc,
+    func,
+    insert,
+    lambda_stmt,
+    text,
+)
+from sqlalchemy.orm import raiseload, selectinload
 
-from app.db.models import Conversation, Message, Document, MessageRole
+from app.db.models import Conversation, Message, MessageRole
 from app.schemas import chat as schemas
 
 
+# Single-statement detail fetch: conversation metadata, one page of messages
+# and the deduplicated file list are assembled into the full response JSON
+# server-side. The message columns are selected under their wire names:
+# MessageResponse serializes metadata_ under its 'metadata' alias, which
+# is also the column name, so no aliasing is needed.
+_GET_DETAILS_SQL = text(
+    """
+    WITH msgs AS (
+        SELECT coalesce(json_agg(row_to_json(m)), '[]'::json) AS data
+        FROM (
+            SELECT id, conversation_id, role, content,
+                   metadata, created_at
+            FROM messages
+            WHERE conversation_id = :cid
+              AND (
+                    CAST(:after_ts AS timestamptz) IS NULL
+                    OR (created_at, id)
+                       > (CAST(:after_ts AS timestamptz), CAST(:after_id AS uuid))
+                  )
+            ORDER BY created_at, id
+            LIMIT :limit OFFSET :offset
+        ) m
+    ),
+    docs AS (
+        SELECT coalesce(json_agg(row_to_json(d)), '[]'::json) AS data
+        FROM (
+            -- file_hash alone is the content identity; grouping only on it
+            -- keeps the hash key narrow and dedups re-uploads of the same
+            -- file under a different path. min() picks a representative
+            -- filename/path per group.
+            SELECT min(filename) AS filename,
+                   min(file_path) AS file_path,
+                   encode(file_hash, 'hex') AS file_hash,
+                   min(created_at) AS created_at
+            FROM documents
+            WHERE conversation_id = :cid AND file_hash IS NOT NULL
+            GROUP BY file_hash
+        ) d
+    )
+    SELECT json_build_object(
+               'id', c.id,
+               'title', c.title,
+               'created_at', c.created_at,
+               'updated_at', c.updated_at,
+               'messages', (SELECT data FROM msgs),
+               'documents', (SELECT data FROM docs)
+           )::text AS detail
+    FROM conversations c
+    WHERE c.id = :cid
+    """
+)
+
+
 class CRUDChat:
     async def create_conversation(
         self, db: AsyncSession, user_id: UUID, obj_in: schemas.ChatCreate
     ) -> schemas.ConversationDetail:
         """
-        Creates a new conversation AND the first message.
-        Returns the detailed schema view.
+        Creates a new conversation AND the first message in one transaction.
+        Both writes are INSERT ... RETURNING, and the response schema is
+        built from the returned values — no post-commit refresh, no
+        get_details re-read of data we just wrote.
         """
         # 1. Create Conversation Entry
-        db_obj = Conversation(
-            user_id=user_id,
-            title=obj_in.first_message[:40] + "...",  # Simple title generation
+        conv_stmt = (
+            insert(Conversation)
+            .values(
+                user_id=user_id,
+                # Title derived in the INSERT itself: left() counts
+                # characters under the DB collation, so multi-byte content
+                # is never sliced mid-code-point like the old Python [:40].
+                title=func.concat(func.left(obj_in.first_message, 40), "..."),
+            )
+            .returning(
+                Conversation.id,
+                Conversation.title,
+                Conversation.created_at,
+                Conversation.updated_at,
+            )
         )
-        db.add(db_obj)
-        await db.flush()  # Generate ID without committing
+        conv_row = (await db.execute(conv_stmt)).one()
 
         # 2. Add First Message
-        first_msg = Message(
-            conversation_id=db_obj.id,
-            role=MessageRole.USER,
-            content=obj_in.first_message,
+        msg_stmt = (
+            insert(Message)
+            .values(
+                conversation_id=conv_row.id,
+                role=MessageRole.USER,
+                content=obj_in.first_message,
+            )
+            .returning(Message)
         )
-        db.add(first_msg)
+        first_msg = (await db.execute(msg_stmt)).scalars().one()
 
         await db.commit()
-        await db.refresh(db_obj)
 
-        # 3. Return the clean schema (reusing get_details logic)
-        return await self.get_details(db, conversation_id=db_obj.id)
+        # 3. Build the schema from what RETURNING gave us
+        return schemas.ConversationDetail(
+            id=conv_row.id,
+            title=conv_row.title,
+            created_at=conv_row.created_at,
+            updated_at=conv_row.updated_at,
+            messages=[schemas.MessageResponse.from_orm_fast(first_msg)],
+            documents=[],
+        )
 
     async def get_details(
-        self, db: AsyncSession, conversation_id: UUID, limit: int = 50, offset: int = 0
-    ) -> Optional[schemas.ConversationDetail]:
+        self,
+        db: AsyncSession,
+        conversation_id: UUID,
+        limit: int = 50,
+        offset: int = 0,
+        after: Optional[Tuple[datetime, UUID]] = None,
+    ) -> Optional[str]:
         """
-        Optimized fetch:
+        Optimized fetch, one round trip:
         1. Conversation Metadata
-        2. Paginated Messages
+        2. Paginated Messages — keyset ((created_at, id) > cursor) when an
+           `after` cursor is given, so page cost stays constant regardless
+           of history length; OFFSET only as the legacy fallback.
         3. Unique Document Files (Grouped by Hash) - No chunks!
-        """
-        # 1. Fetch Conversation (Metadata only)
-        stmt = select(Conversation).where(Conversation.id == conversation_id)
-        result = await db.execute(stmt)
-        conversation = result.scalars().first()
 
-        if not conversation:
-            return None
+        Returns the complete ConversationDetail payload as a JSON string
+        built by json_build_object/json_agg in Postgres. The endpoint
+        passes the bytes straight through — no per-message Pydantic
+        instantiation on the read path. None when the conversation does
+        not exist.
+        """
+        after_created_at, after_id = after if after is not None else (None, None)
 
-        # 2. Fetch Messages (With Pagination)
-        msg_stmt = (
-            select(Message)
-            .where(Message.conversation_id == conversation_id)
-            .order_by(Message.created_at.asc())
-            .offset(offset)
-            .limit(limit)
+        result = await db.execute(
+            _GET_DETAILS_SQL,
+            {
+                "cid": conversation_id,
+                "limit": limit,
+                "offset": offset if after is None else 0,
+                "after_ts": after_created_at,
+                "after_id": after_id,
+            },
         )
-        msg_result = await db.execute(msg_stmt)
-        messages = msg_result.scalars().all()
-
-        # 3. Fetch Unique Documents (Group by Hash/Filename)
-        # This prevents returning 100s of chunks for a single file.
-        doc_stmt = (
-            select(
-                Document.filename,
-                Document.file_path,
-                Document.file_hash,
-                func.min(Document.created_at).label("created_at"),
-            )
-            .where(Document.conversation_id == conversation_id)
-            .where(Document.file_hash.isnot(None)) # Only files with hashes
-            .group_by(Document.filename, Document.file_path, Document.file_hash)
+        return result.scalar_one_or_none()
+
+    async def get_with_context(
+        self, db: AsyncSession, conversation_id: UUID
+    ) -> Optional[Conversation]:
+        """
+        Loads a conversation with its documents eagerly in one pass
+        (selectinload) instead of lazy-loading with an extra round trip.
+        Messages are deliberately NOT loaded here — the chat pipeline only
+        needs a bounded recent window, served by get_recent_messages.
+        raiseload('*') turns any accidental lazy access (a silent extra
+        round trip in prod) into a loud error at dev time.
+        """
+        stmt = (
+            select(Conversation)
+            .options(selectinload(Conversation.documents), raiseload("*"))
+            .where(Conversation.id == conversation_id)
         )
-        doc_result = await db.execute(doc_stmt)
-
-        # Map SQL rows to Pydantic Schema
-        unique_docs = [
-            schemas.DocumentFile(
-                filename=row.filename,
-                file_path=row.file_path,
-                created_at=row.created_at,
-                file_hash=row.file_hash,
-            )
-            for row in doc_result.all()
-        ]
+        result = await db.execute(stmt)
+        return result.scalars().first()
 
-        # 4. Construct & Return Response
-        return schemas.ConversationDetail(
-            id=conversation.id,
-            title=conversation.title,
-            created_at=conversation.created_at,
-            updated_at=conversation.updated_at,
-            messages=messages,
-            documents=unique_docs,
+    async def get_recent_messages(
+        self, db: AsyncSession, conversation_id: UUID, limit: int = 10
+    ) -> List[Message]:
+        """
+        Sliding window for the LLM: last `limit` messages, oldest first.
+        Slicing in SQL keeps us from materializing the entire history just
+        to throw away everything but the tail.
+        """
+        # lambda_stmt freezes the statement shape: the select() AST is built
+        # once per process and later calls only swap bind values.
+        stmt = lambda_stmt(
+            lambda: select(Message)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(desc(Message.created_at))
+            .limit(limit)
         )
+        result = await db.execute(stmt)
+        return list(reversed(result.scalars().all()))
 
     async def get_multi_by_user(
         self, db: AsyncSession, user_id: UUID, skip: int = 0, limit: int = 20
-    ) -> List[Conversation]:
+    ) -> List[schemas.ConversationSummary]:
         """
         Get list of conversations for dashboard (Metadata only).
+
+        Column-level select: the sidebar only needs id/title/timestamps, so
+        we skip ORM instance construction and identity-map bookkeeping and
+        map rows straight into the response schema.
         """
-        query = (
-            select(Conversation)
+        # lambda_stmt: the Core AST for this hot statement is constructed
+        # once; per-call cost is just binding user_id/skip/limit.
+        query = lambda_stmt(
+            lambda: select(
+                Conversation.id,
+                Conversation.title,
+                Conversation.created_at,
+                Conversation.updated_at,
+            )
             .where(Conversation.user_id == user_id)
             .order_by(desc(Conversation.updated_at))
             .offset(skip)
             .limit(limit)
         )
         result = await db.execute(query)
-        return result.scalars().all()
+        # Trusted rows whose keys exactly match the schema fields —
+        # model_construct skips per-row validation.
+        return [
+            schemas.ConversationSummary.model_construct(**row._mapping)
+            for row in result.all()
+        ]
 
     async def create_message(
         self,
@@ -126,9 +237,12 @@ class CRUDChat:
         role: MessageRole,
     ) -> Message:
         """
-        Add a message and update conversation timestamp.
+        Add a message. The parent conversation's updated_at is bumped by a
+        database trigger, not an extra UPDATE from here.
         """
-        # 1. Add Message
+        # Add Message. The conversation's updated_at bump (which keeps the
+        # chat on top of the sidebar list) is handled by the
+        # trg_messages_touch_conversation trigger — no extra statement here.
         db_msg = Message(
             conversation_id=conversation_id,
             role=role,
@@ -136,18 +250,7 @@ class CRUDChat:
             metadata_=None,
         )
         db.add(db_msg)
-
-        # 2. Touch the Conversation 'updated_at' field
-        # This ensures the chat moves to the top of the list in the UI
-        stmt_update = (
-            update(Conversation)
-            .where(Conversation.id == conversation_id)
-            .values(updated_at=func.now())
-        )
-        await db.execute(stmt_update)
-
         await db.commit()
-        await db.refresh(db_msg)
         return db_msg
 
     async def delete_conversation(
@@ -155,20 +258,20 @@ class CRUDChat:
     ) -> bool:
         """
         Deletes a conversation only if it belongs to the specific user.
-        Cascade rules in DB models should handle message/document deletion.
+        Single DELETE ... RETURNING round trip; ON DELETE rules in the DB
+        handle message/document cleanup.
         """
-        stmt = select(Conversation).where(
-            Conversation.id == conversation_id, Conversation.user_id == user_id
+        stmt = (
+            delete(Conversation)
+            .where(
+                Conversation.id == conversation_id, Conversation.user_id == user_id
+            )
+            .returning(Conversation.id)
         )
         result = await db.execute(stmt)
-        chat = result.scalars().first()
-
-        if not chat:
-            return False
-
-        await db.delete(chat)
+        deleted = result.scalar() is not None
         await db.commit()
-        return True
+        return deleted
 
 
 chat = CRUDChat()
@@ -1,11 +1,55 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
+
+import orjson
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import String, cast, desc, func, insert, select, text
 
 from app.db.models import Document
 from app.schemas import document as schemas
 
+# Rows per INSERT statement. Beyond this the VALUES list gets expensive to
+# parse/plan server-side and the bind-parameter count balloons (each chunk
+# row carries a 1536-dim vector), so very large PDFs go in a few slices.
+BULK_INSERT_BATCH = 500
+
+# Column order for the COPY fast path — id/created_at are omitted so the
+# server defaults fill them, same as the INSERT path.
+# Server-side chunk copy for the dedup cache-hit path: the embeddings never
+# leave Postgres. Source rows are pinned to one conversation so a hash shared
+# by several conversations doesn't multiply the copy, and the NOT EXISTS
+# guard makes the statement idempotent — re-running it for a conversation
+# that already holds the file inserts nothing.
+_COPY_CHUNKS_SQL = text(
+    """
+    INSERT INTO documents
+        (conversation_id, filename, file_path, content_snippet,
+         embedding, file_hash, doc_metadata, is_chunk, parent_document_id)
+    SELECT :cid, :fn, :fp, content_snippet,
+           embedding, file_hash, doc_metadata, TRUE, :did
+    FROM documents
+    WHERE conversation_id = :src
+      AND file_hash = :h
+      AND embedding IS NOT NULL
+      AND NOT EXISTS (
+            SELECT 1 FROM documents d
+            WHERE d.conversation_id = :cid AND d.file_hash = :h
+          )
+    """
+)
+
+_COPY_COLUMNS = (
+    "conversation_id",
+    "filename",
+    "file_path",
+    "content_snippet",
+    "embedding",
+    "file_hash",
+    "doc_metadata",
+    "is_chunk",
+    "parent_document_id",
+)
+
 
 class CRUDDocument:
     async def create(
@@ -23,12 +67,128 @@ class CRUDDocument:
         await db.refresh(db_obj)
         return db_obj
 
+    async def bulk_create(
+        self, db: AsyncSession, rows: List[Dict[str, Any]]
+    ) -> List[UUID]:
+        """
+        Inserts many Document rows (chunk ingestion) via multi-row
+        INSERT ... RETURNING, sliced at BULK_INSERT_BATCH rows per
+        statement — a handful of round trips instead of N add/commit
+        cycles, all under one commit. Rows are plain column dicts because
+        chunk rows carry fields (embedding, is_chunk, parent_document_id)
+        the upload schema doesn't.
+        """
+        if not rows:
+            return []
+        ids: List[UUID] = []
+        for start in range(0, len(rows), BULK_INSERT_BATCH):
+            batch = rows[start : start + BULK_INSERT_BATCH]
+            stmt = insert(Document).values(batch).returning(Document.id)
+            ids.extend((await db.execute(stmt)).scalars().all())
+        await db.commit()
+        return ids
+
+    async def copy_chunks(
+        self,
+        db: AsyncSession,
+        src_conversation_id: UUID,
+        dst_conversation_id: UUID,
+        file_hash: bytes,
+        filename: str,
+        file_path: str,
+        parent_document_id: UUID,
+    ) -> int:
+        """
+        Copies an already-embedded file's chunks into another conversation
+        with one INSERT ... SELECT. The old path SELECTed every chunk row
+        (dragging ~3KB of vector each over the wire), rebuilt dicts in
+        Python, and INSERTed them back; server-side the vectors never
+        leave Postgres. Idempotent: returns 0 (and writes nothing) when
+        the destination conversation already has the file.
+        """
+        result = await db.execute(
+            _COPY_CHUNKS_SQL,
+            {
+                "cid": dst_conversation_id,
+                "fn": filename,
+                "fp": file_path,
+                "did": parent_document_id,
+                "src": src_conversation_id,
+                "h": file_hash,
+            },
+        )
+        await db.commit()
+        return result.rowcount
+
+    async def bulk_copy(
+        self, db: AsyncSession, rows: List[Dict[str, Any]], commit: bool = True
+    ) -> int:
+        """
+        COPY fast path for append-only chunk ingestion. COPY skips the
+        parse/plan cost a huge multi-row INSERT pays per batch and streams
+        rows in the wire's binary format — the per-connection pgvector
+        codecs encode embeddings natively. Use bulk_create instead when
+        RETURNING ids are needed or rows may conflict; fresh-chunk
+        ingestion is neither.
+
+        With commit=False the rows stay in the open transaction, letting
+        a pipelined caller COPY several batches and commit once.
+        """
+        if not rows:
+            return 0
+        records = [
+            tuple(
+                orjson.dumps(row[col]).decode()
+                if col == "doc_metadata" and row[col] is not None
+                else row[col]
+                for col in _COPY_COLUMNS
+            )
+            for row in rows
+        ]
+        conn = await db.connection()
+        raw = (await conn.get_raw_connection()).driver_connection
+        await raw.copy_records_to_table(
+            Document.__tablename__, records=records, columns=list(_COPY_COLUMNS)
+        )
+        if commit:
+            await db.commit()
+        return len(records)
+
     async def get_by_conversation(
         self, db: AsyncSession, conversation_id: UUID
-    ) -> List[Document]:
-        query = select(Document).where(Document.conversation_id == conversation_id)
+    ) -> List[Any]:
+        """
+        One row per file via DISTINCT ON, deduplicated in SQL. Selecting the
+        full Document rows would drag every chunk's content_snippet and
+        1536-dim embedding over the wire just to list filenames.
+
+        Unprocessed uploads have no file_hash yet, so the dedup key falls
+        back to the row id to keep them from collapsing into one another.
+        The is_chunk predicate (indexed) excludes RAG chunk rows outright;
+        DISTINCT ON still covers legacy rows written before the flag existed.
+        """
+        # file_hash is raw bytes in the DB; hex-encode for keying/serializing.
+        dedup_key = func.coalesce(
+            func.encode(Document.file_hash, "hex"), cast(Document.id, String)
+        )
+        query = (
+            select(
+                Document.id,
+                Document.filename,
+                Document.file_path,
+                func.encode(Document.file_hash, "hex").label("file_hash"),
+                Document.conversation_id,
+                Document.created_at,
+            )
+            .where(
+                Document.conversation_id == conversation_id,
+                Document.is_chunk.is_(False),
+            )
+            .distinct(dedup_key)
+            .order_by(dedup_key, desc(Document.created_at))
+        )
         result = await db.execute(query)
-        return result.scalars().all()
+        return result.all()
 
 
 document = CRUDDocument()
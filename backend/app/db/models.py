@@ -3,10 +3,20 @@ from datetime import datetime
 from typing import List, Optional, Dict, Any
 from enum import Enum as PyEnum
 
-from sqlalchemy import String, ForeignKey, DateTime, Text, func, Index
+from sqlalchemy import (
+    Boolean,
+    String,
+    ForeignKey,
+    DateTime,
+    LargeBinary,
+    Text,
+    func,
+    text,
+    Index,
+)
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID, JSONB, JSON
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC
 
 from app.db.base_class import Base
 
@@ -56,18 +66,31 @@ class Conversation(Base):
 
     # Relationships
     user: Mapped["User"] = relationship(back_populates="conversations")
+    # passive_deletes: the FK ON DELETE rules do the cleanup in the DB, so
+    # the ORM never loads children just to delete them.
+    # lazy="raise": with AsyncAttrs every implicit lazy load is an extra
+    # round trip on the event loop — force callers to opt in with an
+    # explicit selectinload instead.
     messages: Mapped[List["Message"]] = relationship(
         back_populates="conversation",
         cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise",
         order_by="Message.created_at",
     )
     documents: Mapped[List["Document"]] = relationship(
-        back_populates="conversation", cascade="all, delete-orphan"
+        back_populates="conversation",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise",
     )
 
 
 class Message(Base):
     __tablename__ = "messages"
+    # Fetch server defaults (created_at) via INSERT ... RETURNING at flush
+    # time, so callers never need a post-commit refresh round trip.
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
@@ -91,6 +114,17 @@ class Message(Base):
     # Relationships
     conversation: Mapped["Conversation"] = relationship(back_populates="messages")
 
+    # Composite index so per-conversation history reads (ORDER BY
+    # created_at, id) and keyset pagination are a single index scan.
+    __table_args__ = (
+        Index(
+            "ix_messages_conversation_created",
+            "conversation_id",
+            "created_at",
+            "id",
+        ),
+    )
+
 
 class Document(Base):
     """
@@ -102,8 +136,12 @@ class Document(Base):
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
+    # CASCADE: with passive_deletes on the relationship, the FK rule is
+    # the only thing cleaning chunk rows up when a conversation goes —
+    # SET NULL would strand every chunk (and its ~3KB embedding) in the
+    # table and the HNSW index forever.
     conversation_id: Mapped[Optional[uuid.UUID]] = mapped_column(
-        ForeignKey("conversations.id", ondelete="SET NULL"), nullable=True
+        ForeignKey("conversations.id", ondelete="CASCADE"), nullable=True
     )
 
     filename: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -114,18 +152,35 @@ class Document(Base):
         Text, nullable=True
     )  # Text chunk content
 
+    # Typed discriminator: False for the uploaded file's own row, True for
+    # the RAG chunks derived from it — no content sniffing needed.
+    is_chunk: Mapped[bool] = mapped_column(
+        Boolean, default=False, server_default="false", nullable=False, index=True
+    )
+    # For chunks, points back at the uploaded file's row; cascade removes
+    # all chunks when the upload is deleted.
+    parent_document_id: Mapped[Optional[uuid.UUID]] = mapped_column(
+        ForeignKey("documents.id", ondelete="CASCADE"), nullable=True, index=True
+    )
+
     # Stores flexible info like {"page": 1, "chunk_index": 5, "source": "report.pdf"}
     doc_metadata: Mapped[Optional[Dict[str, Any]]] = mapped_column(
         JSON, nullable=True
     )
 
     # Vector Embedding (1536 dims for OpenAI, 768 for HuggingFace/Llama)
+    # halfvec stores fp16 components: half the memory/bandwidth of vector,
+    # negligible recall loss for cosine at this dimensionality.
     # Ensure you run 'CREATE EXTENSION vector;' in your DB migration!
     embedding: Mapped[Optional[List[float]]] = mapped_column(
-        Vector(1536), nullable=True
+        HALFVEC(1536), nullable=True
+    )
+    # Using compare hash to avoid duplicate uploads. Raw 16-byte MD5 digest
+    # rather than hex text: half the storage/index width, and equality is a
+    # single 128-bit compare. The API layer hex-encodes at the boundary.
+    file_hash: Mapped[Optional[bytes]] = mapped_column(
+        LargeBinary(16), nullable=True
     )
-    # Using compare hash to avoid duplicate uploads
-    file_hash: Mapped[Optional[str]] = mapped_column(String(32), index=True, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -133,13 +188,35 @@ class Document(Base):
     # Relationships
     conversation: Mapped["Conversation"] = relationship(back_populates="documents")
 
-    # Index for fast similarity search
+    # Index for fast similarity search, plus a partial index backing the
+    # per-conversation DISTINCT ON (file_hash) dedup listing.
     __table_args__ = (
         Index(
             "ix_documents_embedding",
             "embedding",
             postgresql_using="hnsw",
-            postgresql_with={"m": 16, "ef_construction": 64},
-            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_with={"m": 24, "ef_construction": 128},
+            postgresql_ops={"embedding": "halfvec_cosine_ops"},
+        ),
+        Index(
+            "ix_documents_conv_hash",
+            "conversation_id",
+            "file_hash",
+            postgresql_where=text("file_hash IS NOT NULL"),
+        ),
+        # Covering index for the global dedup probe: the INCLUDEd
+        # conversation_id makes the "which conversation has this hash"
+        # lookup an index-only scan. Partial — most rows with NULL hashes
+        # are unprocessed uploads nothing ever probes for.
+        Index(
+            "ix_documents_file_hash",
+            "file_hash",
+            postgresql_include=["conversation_id"],
+            postgresql_where=text("file_hash IS NOT NULL"),
+        ),
+        Index(
+            "ix_docs_conv_original",
+            "conversation_id",
+            postgresql_where=text("is_chunk = false"),
         ),
     )
@@ -2,7 +2,7 @@ import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
@@ -26,7 +26,36 @@ async def lifespan(app: FastAPI):
         # 2. Create Tables
         # await conn.run_sync(Base.metadata.drop_all) #  if needed to reset schema
         await conn.run_sync(Base.metadata.create_all)
-    
+
+        # 3. Touch conversations.updated_at from a trigger instead of an
+        # extra UPDATE statement on every message insert
+        await conn.execute(
+            text(
+                """
+                CREATE OR REPLACE FUNCTION touch_conversation() RETURNS trigger AS $$
+                BEGIN
+                    UPDATE conversations SET updated_at = now()
+                    WHERE id = NEW.conversation_id;
+                    RETURN NEW;
+                END $$ LANGUAGE plpgsql
+                """
+            )
+        )
+        await conn.execute(
+            text(
+                "DROP TRIGGER IF EXISTS trg_messages_touch_conversation ON messages"
+            )
+        )
+        await conn.execute(
+            text(
+                """
+                CREATE TRIGGER trg_messages_touch_conversation
+                AFTER INSERT ON messages
+                FOR EACH ROW EXECUTE FUNCTION touch_conversation()
+                """
+            )
+        )
+
     print("✅ Database tables created & pgvector enabled.")
     print("🚀 System is ready to accept connections.")
     
@@ -45,6 +74,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,  # ~2-3x faster JSON encoding
 )
 
 # --- 3. Middlewares ---
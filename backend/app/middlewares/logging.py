@@ -1,73 +1,179 @@
 # File: app/middlewares/logging.py
+import io
+import os
+import random
+import sys
+import threading
 import time
-import json
 import logging
-import uuid
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+
+import orjson
+
 from app.core.config import settings
 
+# Request IDs are tracing correlators, not secrets. uuid4() hits os.urandom
+# (a syscall) and builds a UUID object per request; a process-local PRNG
+# seeded once from urandom gives unique IDs with no syscall and no object.
+_rng = random.Random(os.urandom(32))
+
+
+def fast_request_id() -> str:
+    """128 random bits formatted like a UUID, without the uuid4 syscall."""
+    h = f"{_rng.getrandbits(128):032x}"
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
 
 # Configure Root Logger to output JSON
 class JsonFormatter(logging.Formatter):
+    # Structured fields the middleware attaches via `extra=`. Keeping the
+    # merge here means JSON is only built for records that actually pass
+    # the level filter — not on every request.
+    EXTRA_FIELDS = (
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "client_ip",
+        "request_id",
+    )
+
     def format(self, record):
         log_obj = {
-            "timestamp": self.formatTime(record, self.datefmt),
+            # Epoch seconds straight from the record — strftime per line
+            # costs more than the rest of the serialization combined, and
+            # log pipelines parse numeric timestamps natively.
+            "timestamp": record.created,
             "level": record.levelname,
             "message": record.getMessage(),
             "module": record.module,
         }
-        if hasattr(record, "request_id"):
-            log_obj["request_id"] = record.request_id
-        return json.dumps(log_obj)
+        for field in self.EXTRA_FIELDS:
+            value = record.__dict__.get(field)
+            if value is not None:
+                log_obj[field] = value
+        # orjson: C-level encoding, several times faster than json.dumps
+        # and handles datetime/UUID values without custom encoders.
+        return orjson.dumps(log_obj).decode()
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """
+    StreamHandler minus the flush-per-record: one write() syscall per log
+    line becomes one per ~4KB of lines. WARNING and above still flush
+    immediately so errors are never stuck in the buffer; a background
+    flusher drains the rest every 200ms.
+    """
+
+    FLUSH_INTERVAL_S = 0.2
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            self.stream.write(msg + self.terminator)
+            if record.levelno >= logging.WARNING:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+def _make_handler() -> logging.StreamHandler:
+    raw = getattr(sys.stderr, "buffer", None)
+    if raw is None:
+        # Captured/replaced stderr (tests) — fall back to the plain handler.
+        return logging.StreamHandler()
+    stream = io.TextIOWrapper(
+        io.BufferedWriter(raw, buffer_size=4096),
+        line_buffering=False,
+        write_through=False,
+    )
+    handler = BufferedStreamHandler(stream)
+
+    def _flush_loop():
+        while True:
+            time.sleep(BufferedStreamHandler.FLUSH_INTERVAL_S)
+            try:
+                handler.flush()
+            except Exception:
+                pass
+
+    threading.Thread(target=_flush_loop, name="log-flusher", daemon=True).start()
+    return handler
 
 
 logger = logging.getLogger("api_logger")
-handler = logging.StreamHandler()
+handler = _make_handler()
 handler.setFormatter(JsonFormatter())
 logger.addHandler(handler)
 logger.setLevel(settings.LOG_LEVEL)
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class RequestLoggingMiddleware:
+    """
+    Pure ASGI middleware. BaseHTTPMiddleware routes every request/response
+    through anyio memory streams (an extra task hop and body buffering per
+    request); instrumenting `send` directly avoids all of that — the body
+    stream is never touched, we only observe http.response.start.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # 1. Generate Request ID (for tracing across services)
-        request_id = str(uuid.uuid4())
+        request_id = fast_request_id()
+
+        # 2. Start Timer — perf_counter_ns: monotonic, integer math, no
+        # float wall-clock involved in a duration measurement.
+        start_ns = time.perf_counter_ns()
+        status_code = 500
 
-        # 2. Start Timer
-        start_time = time.time()
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Add Request ID to Response Headers (frontend debugging)
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-request-id", request_id.encode("ascii")),
+                ]
+            await send(message)
 
         # 3. Process Request
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except Exception as e:
             # Log Crash
-            process_time = time.time() - start_time
             logger.error(f"Request failed: {str(e)}", extra={"request_id": request_id})
-            raise e
+            raise
 
         # 4. Calculate Duration
-        process_time = time.time() - start_time
-
-        # 5. Log structured data
-        log_data = {
-            "method": request.method,
-            "path": request.url.path,
-            "status_code": response.status_code,
-            "duration_ms": round(process_time * 1000, 2),
-            "client_ip": request.client.host if request.client else "unknown",
-            "request_id": request_id,
-        }
+        duration_ns = time.perf_counter_ns() - start_ns
 
-        # Log 4xx/5xx as errors/warnings, 2xx as info
-        if response.status_code >= 500:
-            logger.error(json.dumps(log_data), extra={"request_id": request_id})
-        elif response.status_code >= 400:
-            logger.warning(json.dumps(log_data), extra={"request_id": request_id})
+        # 5. Log structured data. The dict goes through `extra=`; the
+        # JsonFormatter serializes it only if the record survives the level
+        # filter, so dropped records cost neither the dict nor json.dumps.
+        if status_code >= 500:
+            level = logging.ERROR
+        elif status_code >= 400:
+            level = logging.WARNING
         else:
-            logger.info(json.dumps(log_data), extra={"request_id": request_id})
-
-        # Add Request ID to Response Headers (for debugging on frontend)
-        response.headers["X-Request-ID"] = request_id
+            level = logging.INFO
 
-        return response
+        if logger.isEnabledFor(level):
+            client = scope.get("client")
+            logger.log(
+                level,
+                "request",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status_code": status_code,
+                    "duration_ms": duration_ns / 1_000_000,
+                    "client_ip": client[0] if client else "unknown",
+                    "request_id": request_id,
+                },
+            )
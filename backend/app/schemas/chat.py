@@ -1,8 +1,8 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Any
 from uuid import UUID
 from datetime import datetime
 from enum import Enum
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
 from app.schemas.document import DocumentResponse
 
 
@@ -17,7 +17,10 @@ class MessageRole(str, Enum):
 class MessageBase(BaseModel):
     role: MessageRole
     content: str
-    metadata_: Optional[Dict[str, Any]] = Field(
+    # Opaque JSON blob (citations, token usage, latency...). Annotated as
+    # Any so Pydantic passes it through instead of walking every nested
+    # dict entry per message.
+    metadata_: Optional[Any] = Field(
         default=None, serialization_alias="metadata"
     )
 
@@ -33,6 +36,17 @@ class MessageCreate(BaseModel):
     doc_ids: Optional[List[str]] = None
 
 
+class MessageQueued(BaseModel):
+    """Ack returned while the AI reply is generated in the background.
+
+    The reply itself is delivered over Socket.IO ('message_delta' /
+    'new_message'), not the HTTP response.
+    """
+
+    status: str = "queued"
+    user_message_id: UUID
+
+
 class MessageResponse(MessageBase):
     id: UUID
     conversation_id: UUID
@@ -40,6 +54,29 @@ class MessageResponse(MessageBase):
 
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
+    @classmethod
+    def from_orm_fast(cls, obj: Any) -> "MessageResponse":
+        """
+        model_construct from a trusted ORM row. Our own Message rows are
+        already typed by SQLAlchemy, so re-validating every field on the
+        hot emit path is pure overhead. Keep model_validate for anything
+        that crosses the API boundary inbound.
+        """
+        data = {f: getattr(obj, f) for f in _MESSAGE_FIELDS}
+        # DB rows carry the role as a plain string; map it through the
+        # precomputed table instead of Enum.__call__ per row.
+        role = data["role"]
+        if not isinstance(role, MessageRole):
+            data["role"] = _ROLE_LOOKUP.get(role, role)
+        return cls.model_construct(**data)
+
+
+# Field names and enum coercion resolved once at import — from_orm_fast
+# runs per message, and cls.model_fields / Enum('user') are dict-build and
+# descriptor work we don't want to repeat per row.
+_MESSAGE_FIELDS = tuple(MessageResponse.model_fields)
+_ROLE_LOOKUP = {r.value: r for r in MessageRole}
+
 
 # Represents a File, not a chunk
 class DocumentFile(BaseModel):
@@ -74,6 +111,12 @@ class ConversationSummary(ConversationBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+# Cached adapter: serializing the whole sidebar list is one call through
+# validator machinery built once at import, instead of FastAPI re-validating
+# each already-constructed model per request.
+CONVERSATION_SUMMARIES = TypeAdapter(List[ConversationSummary])
+
+
 class ConversationDetail(BaseModel):
     id: UUID
     title: str
@@ -1,16 +1,46 @@
-import json
-from typing import TypedDict, List, Annotated, Optional
+import asyncio
+import logging
+import time
+from functools import lru_cache
+from typing import TypedDict, List, Optional
 from uuid import UUID
 
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import BaseMessage, AIMessage, SystemMessage
 from langgraph.graph import StateGraph, END
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from pgvector.sqlalchemy import HALFVEC
+from sqlalchemy import bindparam, select, text
 
+from app.core.config import settings
 from app.services.prompts import prompt_manager
-from app.llm_client import llm_client
+from app.llm_client import get_llm
 from app.services.rag_service import rag_service
-from app.db.models import Document, Conversation
+from app.services.socketio_manager import sio
+from app.db.models import Document
+
+# print() on the async hot path is a blocking stdout write per call; the
+# buffered api_logger coalesces syscalls and drops DEBUG noise in prod.
+logger = logging.getLogger("api_logger")
+
+
+# Micro-batching for token streaming: flushing every token is too chatty for
+# Socket.IO, so we coalesce deltas until either threshold is hit.
+STREAM_FLUSH_SECONDS = 0.05
+STREAM_FLUSH_CHARS = 48
+
+# Retrieval: chunks fed to the LLM, and how far the unfiltered KNN
+# over-fetches before we filter down to the current conversation.
+RETRIEVE_K = 4
+KNN_OVERFETCH = 30
+
+# XML-style block per retrieved chunk — precompiled once; the formatting
+# loop is a single generator pass through str.join.
+_DOC_TEMPLATE = "<document source='{source}' page='{page}'>\n{body}\n</document>"
+
+# Prompts are static configuration — resolve them once at import so the
+# request path never walks the prompt cache at all.
+RAG_SYSTEM_TEMPLATE = prompt_manager.load_prompt("chat.yaml", "rag_system")
+CHAT_SYSTEM_TEMPLATE = prompt_manager.load_prompt("chat.yaml", "chat_system")
 
 
 # --- 1. Define the State ---
@@ -24,144 +54,223 @@ class GraphState(TypedDict):
     context: str
     has_documents: bool
     doc_ids: Optional[List[str]]  # this is file_hash list to filter retrieval
+    stream_id: Optional[str]  # client-side id to correlate message_delta events
+    query_vector: Optional[List[float]]  # pre-computed query embedding, if any
 
 
-# --- 2. Define Nodes ---
+async def stream_llm_response(llm, messages, chat_id, stream_id=None) -> AIMessage:
+    """
+    Streams tokens from the LLM instead of blocking on the full completion.
+    Deltas are micro-batched and emitted to the conversation room so the
+    frontend can render text as it arrives; the full text is returned as a
+    single AIMessage for persistence.
+    """
+    buf: List[str] = []
+    pending: List[str] = []
+    pending_len = 0
+    last_flush = time.monotonic()
+
+    # Hard deadline on the whole stream so a stuck provider can't pin us.
+    async with asyncio.timeout(settings.LLM_TIMEOUT_S):
+        async for chunk in llm.astream(messages):
+            if not chunk.content:
+                continue
+            buf.append(chunk.content)
+            pending.append(chunk.content)
+            pending_len += len(chunk.content)
+
+            now = time.monotonic()
+            if (
+                pending_len >= STREAM_FLUSH_CHARS
+                or (now - last_flush) >= STREAM_FLUSH_SECONDS
+            ):
+                await sio.emit_to_room(
+                    room=str(chat_id),
+                    event="message_delta",
+                    data={"delta": "".join(pending), "msg_id": stream_id},
+                )
+                pending.clear()
+                pending_len = 0
+                last_flush = now
+
+    # Flush whatever is left after the stream ends
+    if pending:
+        await sio.emit_to_room(
+            room=str(chat_id),
+            event="message_delta",
+            data={"delta": "".join(pending), "msg_id": stream_id},
+        )
 
+    return AIMessage(content="".join(buf))
 
-async def check_documents(state: GraphState):
+
+@lru_cache(maxsize=1)
+def _chat_system_message() -> SystemMessage:
     """
-    Node 1: Check if this chat even has documents attached.
+    The casual-chat system prompt is fully static, so build it once and
+    reuse the identical object every call. Providers with prompt caching
+    (OpenAI, Groq, Anthropic) only get prefix hits when we send the exact
+    same bytes each turn.
     """
-    print("🤖 Graph Node: Checking Documents...")
-    db = state["db_session"]
-    chat_id = state["chat_id"]
+    return SystemMessage(
+        content=CHAT_SYSTEM_TEMPLATE.format(history="See messages below.")
+    )
 
-    # Check DB for any docs linked to this chat
-    stmt = select(Document.id).where(Document.conversation_id == chat_id).limit(1)
-    result = await db.execute(stmt)
-    has_docs = result.scalars().first() is not None
 
-    return {"has_documents": has_docs}
+# --- 2. Define Nodes ---
 
 
 async def retrieve(state: GraphState):
     """
-    Node 2: Retrieve relevant chunks from Postgres (HNSW) and format with Metadata.
+    Node 1: Retrieve relevant chunks from Postgres (HNSW) and format with
+    Metadata. Also decides the route: the endpoints already know whether
+    the conversation has documents (threaded in as has_documents), so a
+    document-less turn short-circuits to casual chat here without any
+    probe or embedding call.
     """
-    print("🤖 Graph Node: Retrieving Context...")
+    logger.debug("🤖 Graph Node: Retrieving Context...")
 
     query = state["user_query"]
     db = state["db_session"]
     chat_id = state["chat_id"]
-    filter_hashes = state.get("doc_ids", None)
+    # doc_ids arrive from the API as hex strings; the column stores raw
+    # digest bytes. Malformed entries are dropped (they'd match nothing).
+    filter_hashes = {
+        bytes.fromhex(h)
+        for h in (state.get("doc_ids") or [])
+        if len(h) == 32 and all(c in "0123456789abcdefABCDEF" for c in h)
+    } or None
+
+    # 1. Embed the User Query (unless the endpoint already did it in parallel
+    # with the user-message persist). Both endpoints inspect the
+    # conversation's documents before invoking the graph — a brand-new chat
+    # has none, and send_message loads them with the conversation — so when
+    # the caller saw none we route straight to casual chat without paying
+    # an embedding-provider round trip or a probe. That document-less turn
+    # is the default path, not the exception.
+    query_vector = state.get("query_vector")
+    if query_vector is None:
+        if not state.get("has_documents"):
+            logger.debug("💬 No documents attached — routing to casual chat.")
+            return {"has_documents": False, "context": ""}
+        query_vector = await rag_service.embed_query_cached(query)
+
+    # 2. Vector Search (unfiltered KNN, then filter post-hoc)
+    # A selective WHERE on conversation_id forces Postgres to filter during
+    # HNSW graph traversal, which defeats the index. We instead run the KNN
+    # over the whole table, over-fetch, and keep the first K rows belonging
+    # to this chat (and matching any Select-to-Talk file-hash filter).
+    # SET LOCAL scopes the HNSW candidate-list size to this transaction only.
+    if filter_hashes:
+        logger.debug("🎯 [FILTER] Restricting search to file hashes: %s", filter_hashes)
 
-    # --- [DEBUG START] for Demo Purposes ---
-    # This block proves your filtering logic works during the presentation
-    count_stmt = select(Document).where(
-        Document.conversation_id == chat_id, Document.embedding.isnot(None)
+    await db.execute(
+        text(f"SET LOCAL hnsw.ef_search = {int(settings.HNSW_EF_SEARCH)}")
     )
-    count_result = await db.execute(count_stmt)
-    total_chunks = len(count_result.scalars().all())
-    print(f"🔍 [DEBUG] Total chunks available in this chat: {total_chunks}")
-    # --- [DEBUG END] ---
-
-    # 1. Embed the User Query
-    query_vector = rag_service.embeddings.embed_query(query)
-
-    # 2. Build the Base Query
-    stmt = select(Document).where(
-        Document.conversation_id == chat_id,
-        Document.embedding.isnot(None),
+    # Column projection: the formatter needs snippet/filename/metadata and
+    # the post-filter needs conversation_id/file_hash. Selecting whole
+    # Document rows would drag every candidate's 1536-dim embedding (~3KB
+    # each, × KNN_OVERFETCH rows) back over the wire just to throw it away.
+    _RETRIEVE_COLS = (
+        Document.conversation_id,
+        Document.file_hash,
+        Document.filename,
+        Document.content_snippet,
+        Document.doc_metadata,
     )
-
-    # 3. Apply Filters (Select-to-Talk)
-    if filter_hashes:
-        print(f"🎯 [FILTER] Restricting search to file hashes: {filter_hashes}")
-
-        # [DEBUG] Verify if these hashes actually exist in the DB
-        check_stmt = (
-            select(Document.id)
-            .where(
-                Document.conversation_id == chat_id,
-                Document.file_hash.in_(filter_hashes),
-            )
-            .limit(1)
+    # Typed bind: the vector ships once as a halfvec parameter (binary via
+    # the registered asyncpg codec) instead of being re-coerced per
+    # expression, and the distance stays halfvec <=> halfvec so the
+    # halfvec_cosine_ops HNSW index qualifies.
+    qv = bindparam("qv", query_vector, type_=HALFVEC(settings.VECTOR_DIMENSION))
+    knn_stmt = (
+        select(*_RETRIEVE_COLS)
+        .where(Document.embedding.isnot(None))
+        .order_by(Document.embedding.cosine_distance(qv))
+        .limit(KNN_OVERFETCH)
+    )
+    result = await db.execute(knn_stmt)
+    candidates = result.all()
+
+    docs = [
+        doc
+        for doc in candidates
+        if doc.conversation_id == chat_id
+        and (not filter_hashes or doc.file_hash in filter_hashes)
+    ][:RETRIEVE_K]
+
+    # 3. Fallback: on a large corpus the global top-30 may not contain this
+    # chat's chunks at all — rerun with the predicate pushed down so recall
+    # never regresses to zero.
+    if not docs:
+        fallback_stmt = select(*_RETRIEVE_COLS).where(
+            Document.conversation_id == chat_id,
+            Document.embedding.isnot(None),
         )
-        check_res = await db.execute(check_stmt)
-        if not check_res.scalars().first():
-            print(
-                f"⚠️ [WARNING] The requested file hashes {filter_hashes} were NOT found in this chat's context!"
+        if filter_hashes:
+            fallback_stmt = fallback_stmt.where(
+                Document.file_hash.in_(filter_hashes)
             )
+        fallback_stmt = fallback_stmt.order_by(
+            Document.embedding.cosine_distance(qv)
+        ).limit(RETRIEVE_K)
+        result = await db.execute(fallback_stmt)
+        docs = result.all()
 
-        stmt = stmt.where(Document.file_hash.in_(filter_hashes))
-
-    # 4. Vector Search
-    stmt = stmt.order_by(Document.embedding.cosine_distance(query_vector)).limit(4)
-
-    # 5. Execute
-    result = await db.execute(stmt)
-    docs = result.scalars().all()
-
-    # 6. Format Context with Metadata for Citations
-    formatted_chunks = []
-
+    # 4. Format Context with Metadata for Citations
     if not docs:
-        print("⚠️ No relevant documents found.")
-        return {"context": ""}
-
-    for doc in docs:
-        # Handle Legacy Data
-        meta = doc.doc_metadata if doc.doc_metadata else {}
-
-        source_file = meta.get("source", doc.filename)
-        page_num = meta.get("page_number", "N/A")
-
-        # XML-style block for high precision
-        chunk_block = (
-            f"<document source='{source_file}' page='{page_num}'>\n"
-            f"{doc.content_snippet}\n"
-            f"</document>"
+        logger.warning("⚠️ No relevant documents found.")
+        return {"has_documents": True, "context": ""}
+
+    # Single pass: join over a generator, no intermediate chunk list.
+    # (doc_metadata or {}) handles legacy rows without metadata.
+    context_text = "\n\n".join(
+        _DOC_TEMPLATE.format_map(
+            {
+                "source": (doc.doc_metadata or {}).get("source", doc.filename),
+                "page": (doc.doc_metadata or {}).get("page_number", "N/A"),
+                "body": doc.content_snippet,
+            }
         )
-        formatted_chunks.append(chunk_block)
-
-    context_text = "\n\n".join(formatted_chunks)
+        for doc in docs
+    )
 
-    print(f"📚 Retrieved {len(docs)} chunks.")
-    print(f"📄 Context preview: {context_text[:200]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📚 Retrieved %d chunks. Preview: %s...", len(docs), context_text[:200])
 
-    return {"context": context_text}
+    return {"has_documents": True, "context": context_text}
 
 
 async def generate_rag(state: GraphState):
     """
     Node 3a: Generate Answer using RAG Context.
     """
-    print("🤖 Graph Node: Generating RAG Response...")
+    logger.debug("🤖 Graph Node: Generating RAG Response...")
 
     context = state.get("context", "")
-    print(f"📋 Context length: {len(context)} characters")
+    logger.debug("📋 Context length: %d characters", len(context))
     if not context or len(context.strip()) == 0:
-        print("⚠️ WARNING: Empty context! LLM will not have document information.")
+        logger.warning("⚠️ Empty context! LLM will not have document information.")
         return {
             "messages": [
                 AIMessage(content="I cannot find that information in the documents.")
             ]
         }
 
-    # Load Prompt from YAML
-    system_template = prompt_manager.load_prompt("chat.yaml", "rag_system")
-    system_msg = system_template.format(context=context)
+    # The template keeps {context} at the very end so the instruction prefix
+    # stays bit-stable across turns and provider prompt caching can hit.
+    system_msg = RAG_SYSTEM_TEMPLATE.format(context=context)
 
-    print(f"📝 System prompt length: {len(system_msg)} characters")
-    print(f"💬 User query: {state.get('user_query', 'N/A')}")
+    logger.debug("📝 System prompt length: %d characters", len(system_msg))
 
     messages = [SystemMessage(content=system_msg)] + state["messages"]
 
-    llm = llm_client.get_llm()
-    response = llm.invoke(messages)
+    response = await stream_llm_response(
+        get_llm(), messages, state["chat_id"], state.get("stream_id")
+    )
 
-    print(f"✅ LLM Response: {response.content[:100]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("✅ LLM Response: %s...", response.content[:100])
 
     return {"messages": [response]}
 
@@ -170,16 +279,14 @@ async def generate_chat(state: GraphState):
     """
     Node 3b: General Conversation (No RAG).
     """
-    print("🤖 Graph Node: Generating Casual Response...")
+    logger.debug("🤖 Graph Node: Generating Casual Response...")
 
-    system_template = prompt_manager.load_prompt("chat.yaml", "chat_system")
-    # We could summarize history here, but for now we just pass it
-    system_msg = system_template.format(history="See messages below.")
+    # Static system prompt — same object (and bytes) every call
+    messages = [_chat_system_message()] + state["messages"]
 
-    messages = [SystemMessage(content=system_msg)] + state["messages"]
-
-    llm = llm_client.get_llm()
-    response = llm.invoke(messages)
+    response = await stream_llm_response(
+        get_llm(), messages, state["chat_id"], state.get("stream_id")
+    )
 
     return {"messages": [response]}
 
@@ -189,36 +296,43 @@ async def generate_chat(state: GraphState):
 
 def route_request(state: GraphState):
     """
-    Edge: Decides where to go next.
+    Edge: Decides where to go next after retrieval.
     """
     if state["has_documents"]:
-        return "retrieve"
+        return "generate_rag"
     return "generate_chat"
 
 
 # --- 4. Build the Graph ---
 
-workflow = StateGraph(GraphState)
 
-workflow.add_node("check_documents", check_documents)
-workflow.add_node("retrieve", retrieve)
-workflow.add_node("generate_rag", generate_rag)
-workflow.add_node("generate_chat", generate_chat)
+@lru_cache(maxsize=1)
+def get_app_graph():
+    """
+    Builds and compiles the graph on first use. workflow.compile() walks
+    langgraph machinery — deferring it keeps module import cheap (test
+    discovery, workers that never chat) and the cache makes it a
+    one-time cost.
+    """
+    workflow = StateGraph(GraphState)
 
-# Entry Point
-workflow.set_entry_point("check_documents")
+    workflow.add_node("retrieve", retrieve)
+    workflow.add_node("generate_rag", generate_rag)
+    workflow.add_node("generate_chat", generate_chat)
 
-# Conditional Edge
-workflow.add_conditional_edges(
-    "check_documents",
-    route_request,
-    {"retrieve": "retrieve", "generate_chat": "generate_chat"},
-)
+    # Entry Point — retrieve doubles as the document check (fused, one less
+    # round trip per turn)
+    workflow.set_entry_point("retrieve")
+
+    # Conditional Edge
+    workflow.add_conditional_edges(
+        "retrieve",
+        route_request,
+        {"generate_rag": "generate_rag", "generate_chat": "generate_chat"},
+    )
 
-# Normal Edges
-workflow.add_edge("retrieve", "generate_rag")
-workflow.add_edge("generate_rag", END)
-workflow.add_edge("generate_chat", END)
+    # Normal Edges
+    workflow.add_edge("generate_rag", END)
+    workflow.add_edge("generate_chat", END)
 
-# Compile
-app_graph = workflow.compile()
+    return workflow.compile()
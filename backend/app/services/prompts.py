@@ -9,20 +9,30 @@ class PromptManager:
         # Resolves to project_root/app/prompts
         self.prompt_dir = Path(__file__).parent.parent / "prompts"
         self._cache: Dict[str, Any] = {}
+        # Fully-resolved template strings keyed by (filename, key) — repeat
+        # lookups (every chat turn) are a single dict hit instead of a
+        # nested .get() walk over the parsed YAML.
+        self._resolved: Dict[tuple, str] = {}
 
     def load_prompt(self, filename: str, key: str) -> str:
         """
         Loads a specific key from a YAML file.
         Example: load_prompt("chat.yaml", "rag_system")
         """
+        resolved = self._resolved.get((filename, key))
+        if resolved is not None:
+            return resolved
+
         if filename not in self._cache:
             file_path = self.prompt_dir / filename
             if not file_path.exists():
                 raise FileNotFoundError(f"Prompt file not found: {file_path}")
-            
+
             with open(file_path, "r") as f:
                 self._cache[filename] = yaml.safe_load(f)
-        
-        return self._cache[filename].get(key, {}).get("content", "")
+
+        resolved = self._cache[filename].get(key, {}).get("content", "")
+        self._resolved[(filename, key)] = resolved
+        return resolved
 
 prompt_manager = PromptManager()
\ No newline at end of file
@@ -3,10 +3,15 @@ from typing import Any
 from app.core.config import settings
 
 
+# Dedicated pub/sub channel so socket fanout traffic doesn't share the
+# default 'socketio' channel with any other app on the same Redis.
+SOCKETIO_CHANNEL = "botgpt"
+
+
 class SocketManager:
     def __init__(self):
         # Redis Manager allows this to scale across multiple workers/containers
-        mgr = socketio.AsyncRedisManager(settings.REDIS_URL)
+        mgr = socketio.AsyncRedisManager(settings.REDIS_URL, channel=SOCKETIO_CHANNEL)
 
         # Async Server
         self.server = socketio.AsyncServer(
@@ -1,15 +1,18 @@
 import pytest
 import pytest_asyncio
-import asyncio
 import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+from langchain_core.messages import AIMessage
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import text
 from httpx import AsyncClient, ASGITransport
 
 from app.main import app
+from app.core.celery_app import celery_app
 from app.core.config import settings
-from app.db.models import User
+from app.db.models import User, Conversation, Message, MessageRole
 from app.db.base import Base
 from app.api.deps import get_current_user
 
@@ -17,39 +20,67 @@ from app.api.deps import get_current_user
 TEST_USER_ID = uuid.UUID("17713e72-cba9-44cd-82eb-8c75b66d769b")
 TEST_USER_EMAIL = "test_user@botgpt.com"
 
+# Keep Celery away from real infrastructure during tests: never execute
+# tasks eagerly (the upload tests mock .delay, and an unmocked dispatch
+# should fail fast on the in-memory broker rather than hit Redis).
+celery_app.conf.task_always_eager = False
+celery_app.conf.task_store_eager_result = False
+celery_app.conf.broker_url = "memory://"
+celery_app.conf.result_backend = "cache+memory://"
 
-# 2. Global Event Loop (Fixes loop mismatch errors)
-@pytest.fixture(scope="session")
-def event_loop():
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-    yield loop
-    loop.close()
+
+# Slow full-stack tests (multipart upload, pagination loops) are opt-in:
+# the default run stays fast for dev iteration, CI passes --runslow.
+def pytest_addoption(parser):
+    parser.addoption(
+        "--runslow",
+        action="store_true",
+        default=False,
+        help="also run tests marked slow",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip_slow = pytest.mark.skip(reason="slow test: pass --runslow to run")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+
+# 2. Event loop: one session-scoped loop for every test and async fixture,
+# configured via asyncio_default_*_loop_scope in pyproject.toml. (The old
+# hand-rolled event_loop fixture is unsupported in pytest-asyncio 1.x.)
 
 
 # 3. Database Setup (Create tables once per session)
-@pytest_asyncio.fixture(scope="function")
+# Session scope: building the engine, the vector extension, and the whole
+# schema per test dominated suite runtime. The schema needs Postgres
+# (halfvec columns, HNSW indexes), so the usual in-memory SQLite trick is
+# not an option — instead the schema is built once and tests isolate by
+# truncating between runs, which is orders of magnitude cheaper than
+# drop_all/create_all.
+@pytest_asyncio.fixture(scope="session")
 async def db_engine():
-    """Create a test database engine and set up tables."""
+    """Create one test database engine and schema for the whole session."""
     engine = create_async_engine(
         settings.ASYNC_DATABASE_URL,
         echo=False,  # Set to True for SQL debugging
         pool_pre_ping=True,
     )
-    
+
     # Create tables and enable pgvector
     async with engine.begin() as conn:
         await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         await conn.run_sync(Base.metadata.create_all)
-    
+
     yield engine
-    
+
     # Cleanup: Drop all tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
-    
+
     await engine.dispose()
 
 
@@ -58,18 +89,26 @@ async def db_engine():
 async def db_session(db_engine):
     """Create a database session for each test."""
     async_session = async_sessionmaker(
-        bind=db_engine, 
+        bind=db_engine,
         expire_on_commit=False,
         class_=AsyncSession
     )
-    
+
     session = async_session()
     try:
         yield session
     finally:
-        # Clean up: rollback any uncommitted changes and close
+        # Clean up: rollback any uncommitted changes, wipe the shared
+        # schema for the next test, and close
         try:
             await session.rollback()
+            await session.execute(
+                text(
+                    "TRUNCATE TABLE messages, documents, conversations, users "
+                    "RESTART IDENTITY CASCADE"
+                )
+            )
+            await session.commit()
         except Exception:
             pass
         try:
@@ -79,7 +118,9 @@ async def db_session(db_engine):
 
 
 # 5. Override Database Dependency (includes user seeding)
-@pytest_asyncio.fixture(scope="function")
+# autouse: the session-scoped client below can't carry the per-test db
+# override itself, so every test installs it (and the seeded user) here.
+@pytest_asyncio.fixture(scope="function", autouse=True)
 async def override_get_db(db_session):
     """Override the get_db dependency to use test database and seed user."""
     # Seed user when database is used
@@ -112,18 +153,73 @@ async def override_get_db(db_session):
 
 
 # 7. HTTP Client & Auth Override
-@pytest_asyncio.fixture(scope="function")
-async def client(override_get_db):
-    """Create an async HTTP client for testing."""
+# Session scope: the transport, client (with its connection machinery),
+# and auth override are built once for the whole suite instead of per
+# test. Per-test state lives in the autouse override_get_db above; the
+# transport resolves dependency_overrides at request time, so a shared
+# client still sees each test's session.
+@pytest_asyncio.fixture(scope="session")
+async def client():
+    """One async HTTP client shared across the test session."""
     async def mock_get_current_user():
         return User(id=TEST_USER_ID, email=TEST_USER_EMAIL)
 
     app.dependency_overrides[get_current_user] = mock_get_current_user
 
+    transport = ASGITransport(app=app)
     async with AsyncClient(
-        transport=ASGITransport(app=app), base_url="http://test"
+        transport=transport, base_url="http://test", follow_redirects=False
     ) as ac:
         yield ac
 
     # Cleanup
     app.dependency_overrides.pop(get_current_user, None)
+
+
+# 8. Seeded conversation
+# Most tests only need an existing conversation to act on; POSTing one
+# through the API costs a graph invocation + Socket.IO emits + three ORM
+# writes per test. Inserting the rows directly is one round trip.
+@pytest_asyncio.fixture
+async def chat_id(override_get_db, db_session):
+    """Id of a conversation (with one user message) inserted straight
+    into the test database, bypassing the create endpoint."""
+    conv = Conversation(user_id=TEST_USER_ID, title="Test conversation")
+    db_session.add(conv)
+    await db_session.flush()
+    db_session.add(
+        Message(
+            conversation_id=conv.id, role=MessageRole.USER.value, content="Hello"
+        )
+    )
+    await db_session.commit()
+    return str(conv.id)
+
+
+# 9. Default LLM-graph & Socket.IO mocks (autouse)
+# Every API test needs the graph and the emitter stubbed out; patching them
+# here once replaces the @patch stack + 6-line setup that used to open each
+# test. Tests that assert calls or need specific content just take
+# `mock_graph` / `mock_sio` as parameters and override `ainvoke.return_value`.
+DEFAULT_GRAPH_RESULT = {
+    "messages": [AIMessage(content="Test response")],
+    "context": "",
+    "has_documents": False,
+}
+
+
+@pytest.fixture(autouse=True)
+def mock_graph(monkeypatch):
+    """Stand-in for the compiled LangGraph, answering DEFAULT_GRAPH_RESULT."""
+    graph = MagicMock()
+    graph.ainvoke = AsyncMock(return_value=DEFAULT_GRAPH_RESULT)
+    monkeypatch.setattr("app.api.v1.endpoints.chats.get_app_graph", lambda: graph)
+    return graph
+
+
+@pytest.fixture(autouse=True)
+def mock_sio(monkeypatch):
+    """Stubs the shared Socket.IO emitter so no Redis manager is touched."""
+    emit = AsyncMock(return_value=None)
+    monkeypatch.setattr("app.services.socketio_manager.sio.emit_to_room", emit)
+    return emit
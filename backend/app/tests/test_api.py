@@ -1,11 +1,26 @@
 """
-Comprehensive API tests with proper mocking for LLM, SocketIO, and Celery.
+Comprehensive API tests. The LLM graph and Socket.IO emitter are stubbed
+for every test by the autouse `mock_graph` / `mock_sio` fixtures in
+conftest.py; tests name them only to assert calls or override the answer.
 """
 import pytest
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import patch
 from uuid import uuid4
 from langchain_core.messages import AIMessage
 
+# Deterministic graph replies, built once — message construction runs
+# pydantic validation, so per-test literals add up across the suite.
+_HELLO_RESULT = {
+    "messages": [AIMessage(content="Hello! How can I help you today?")],
+    "context": "",
+    "has_documents": False,
+}
+
+# One tiny upload payload shared by the document tests. Multipart parse
+# time scales with body size, and the endpoint only checks the filename
+# extension, so the 5-byte PDF magic is enough.
+_PDF_FILES = {"file": ("test.pdf", b"%PDF-", "application/pdf")}
+
 
 @pytest.mark.asyncio
 async def test_health_live(client):
@@ -43,18 +58,9 @@ async def test_root_endpoint(client):
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_create_conversation(mock_sio, mock_graph, client):
+async def test_create_conversation(client, mock_graph, mock_sio):
     """Test creating a new conversation with mocked LLM."""
-    # Mock LLM graph response
-    mock_ai_message = AIMessage(content="Hello! How can I help you today?")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
+    mock_graph.ainvoke.return_value = _HELLO_RESULT
 
     payload = {"first_message": "Hello BotGPT!"}
 
@@ -71,24 +77,14 @@ async def test_create_conversation(mock_sio, mock_graph, client):
     assert "created_at" in data
 
     # Verify LLM was called
-    mock_graph.assert_called_once()
-    # Verify SocketIO was called (at least once for user message, once for AI)
-    assert mock_sio.call_count >= 1
+    mock_graph.ainvoke.assert_called_once()
+    # Verify SocketIO: user + AI messages go out as one message_pair emit
+    assert mock_sio.call_count == 1
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_create_conversation_with_doc_ids(mock_sio, mock_graph, client):
+async def test_create_conversation_with_doc_ids(client):
     """Test creating conversation with document IDs."""
-    mock_ai_message = AIMessage(content="I can help you with your documents!")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": True,
-    }
-    mock_sio.return_value = None
-
     doc_id = str(uuid4())
     payload = {"first_message": "What's in my document?", "doc_ids": [doc_id]}
 
@@ -99,31 +95,16 @@ async def test_create_conversation_with_doc_ids(mock_sio, mock_graph, client):
 
 
 @pytest.mark.asyncio
-async def test_create_conversation_validation_error(client):
+@pytest.mark.parametrize("payload", [{"first_message": ""}, {}])
+async def test_create_conversation_validation_error(client, payload):
     """Test conversation creation with invalid payload."""
-    # Empty message
-    response = await client.post("/api/v1/conversations/", json={"first_message": ""})
-    assert response.status_code == 422
-
-    # Missing field
-    response = await client.post("/api/v1/conversations/", json={})
+    response = await client.post("/api/v1/conversations/", json=payload)
     assert response.status_code == 422
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_list_conversations(mock_sio, mock_graph, client):
+async def test_list_conversations(client):
     """Test listing conversations."""
-    # Create a conversation first
-    mock_ai_message = AIMessage(content="Test response")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
-
     await client.post("/api/v1/conversations/", json={"first_message": "Test 1"})
     await client.post("/api/v1/conversations/", json={"first_message": "Test 2"})
 
@@ -144,18 +125,9 @@ async def test_list_conversations(mock_sio, mock_graph, client):
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_list_conversations_pagination(mock_sio, mock_graph, client):
+@pytest.mark.slow
+async def test_list_conversations_pagination(client):
     """Test conversation list pagination."""
-    mock_ai_message = AIMessage(content="Test")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
-
     # Create multiple conversations
     for i in range(5):
         await client.post(
@@ -173,25 +145,8 @@ async def test_list_conversations_pagination(mock_sio, mock_graph, client):
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_get_conversation(mock_sio, mock_graph, client):
+async def test_get_conversation(client, chat_id):
     """Test getting a specific conversation."""
-    mock_ai_message = AIMessage(content="Test response")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
-
-    # Create conversation
-    create_res = await client.post(
-        "/api/v1/conversations/", json={"first_message": "Get me"}
-    )
-    chat_id = create_res.json()["id"]
-
-    # Get conversation
     response = await client.get(f"/api/v1/conversations/{chat_id}")
     assert response.status_code == 200
     data = response.json()
@@ -202,100 +157,61 @@ async def test_get_conversation(mock_sio, mock_graph, client):
 
 
 @pytest.mark.asyncio
-async def test_get_conversation_not_found(client):
-    """Test getting non-existent conversation."""
-    fake_id = str(uuid4())
-    response = await client.get(f"/api/v1/conversations/{fake_id}")
+@pytest.mark.parametrize(
+    "method,path_tmpl,payload",
+    [
+        ("get", "/api/v1/conversations/{id}", None),
+        ("delete", "/api/v1/conversations/{id}", None),
+        (
+            "post",
+            "/api/v1/conversations/{id}/messages",
+            {"content": "Hello", "role": "user"},
+        ),
+    ],
+    ids=["get", "delete", "send_message"],
+)
+async def test_conversation_not_found(client, method, path_tmpl, payload):
+    """Every conversation endpoint 404s on a non-existent id."""
+    path = path_tmpl.format(id=uuid4())
+    kwargs = {"json": payload} if payload is not None else {}
+    response = await getattr(client, method)(path, **kwargs)
     assert response.status_code == 404
     assert "not found" in response.json()["detail"].lower()
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_send_message(mock_sio, mock_graph, client):
+async def test_send_message(client, chat_id, mock_graph):
     """Test sending a message to a conversation."""
-    mock_ai_message = AIMessage(content="I'm here to help!")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
-
-    # Create conversation
-    start_res = await client.post(
-        "/api/v1/conversations/", json={"first_message": "Init"}
-    )
-    chat_id = start_res.json()["id"]
-
-    # Send message
+    # Send message — the endpoint acks immediately; the AI reply is
+    # generated in the background and delivered over Socket.IO.
     payload = {"content": "Who are you?", "role": "user"}
     response = await client.post(
         f"/api/v1/conversations/{chat_id}/messages", json=payload
     )
 
-    assert response.status_code == 200
+    assert response.status_code == 202
     data = response.json()
-    assert data["role"] == "assistant"
-    assert "content" in data
-    assert data["conversation_id"] == chat_id
-    assert "id" in data
-    assert "created_at" in data
+    assert data["status"] == "queued"
+    assert "user_message_id" in data
 
-    # Verify LLM was called
-    mock_graph.assert_called()
+    # Verify LLM was called (background task runs before the transport returns)
+    mock_graph.ainvoke.assert_called()
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_send_message_conversation_not_found(mock_sio, mock_graph, client):
-    """Test sending message to non-existent conversation."""
-    fake_id = str(uuid4())
-    payload = {"content": "Hello", "role": "user"}
-    response = await client.post(
-        f"/api/v1/conversations/{fake_id}/messages", json=payload
-    )
-    assert response.status_code == 404
-
-
-@pytest.mark.asyncio
-async def test_send_message_validation_error(client):
+@pytest.mark.parametrize("payload", [{"content": ""}, {}])
+async def test_send_message_validation_error(client, payload):
     """Test sending message with invalid payload."""
     fake_id = str(uuid4())
-    # Empty content
-    response = await client.post(
-        f"/api/v1/conversations/{fake_id}/messages", json={"content": ""}
-    )
-    assert response.status_code == 422
-
-    # Missing content
     response = await client.post(
-        f"/api/v1/conversations/{fake_id}/messages", json={}
+        f"/api/v1/conversations/{fake_id}/messages", json=payload
     )
     assert response.status_code == 422
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_delete_conversation(mock_sio, mock_graph, client):
+async def test_delete_conversation(client, chat_id):
     """Test deleting a conversation."""
-    mock_ai_message = AIMessage(content="Test")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
-
-    # Create conversation
-    start_res = await client.post(
-        "/api/v1/conversations/", json={"first_message": "Delete me"}
-    )
-    chat_id = start_res.json()["id"]
-
     # Delete conversation
     response = await client.delete(f"/api/v1/conversations/{chat_id}")
     assert response.status_code == 204
@@ -305,44 +221,20 @@ async def test_delete_conversation(mock_sio, mock_graph, client):
     assert get_res.status_code == 404
 
 
-@pytest.mark.asyncio
-async def test_delete_conversation_not_found(client):
-    """Test deleting non-existent conversation."""
-    fake_id = str(uuid4())
-    response = await client.delete(f"/api/v1/conversations/{fake_id}")
-    assert response.status_code == 404
-
-
 # --- Document Tests ---
 
 
 @pytest.mark.asyncio
+@pytest.mark.slow
 @patch("app.api.v1.endpoints.documents.ingest_pdf_task.delay")
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_upload_document(mock_sio, mock_graph, mock_celery, client):
+async def test_upload_document(mock_celery, client, chat_id):
     """Test uploading a document."""
-    mock_ai_message = AIMessage(content="Test")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
     mock_celery.return_value = None
 
-    # Create conversation first
-    create_res = await client.post(
-        "/api/v1/conversations/", json={"first_message": "Upload test"}
-    )
-    chat_id = create_res.json()["id"]
-
-    # Create a mock PDF file
-    files = {"file": ("test.pdf", b"%PDF-1.4 fake pdf content", "application/pdf")}
     data = {"conversation_id": chat_id}
 
     response = await client.post(
-        "/api/v1/documents/", files=files, data=data
+        "/api/v1/documents/", files=_PDF_FILES, data=data
     )
 
     assert response.status_code == 201
@@ -358,23 +250,8 @@ async def test_upload_document(mock_sio, mock_graph, mock_celery, client):
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_upload_document_invalid_file_type(mock_sio, mock_graph, client):
+async def test_upload_document_invalid_file_type(client, chat_id):
     """Test uploading non-PDF file."""
-    mock_ai_message = AIMessage(content="Test")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
-
-    create_res = await client.post(
-        "/api/v1/conversations/", json={"first_message": "Test"}
-    )
-    chat_id = create_res.json()["id"]
-
     # Try to upload non-PDF
     files = {"file": ("test.txt", b"text content", "text/plain")}
     data = {"conversation_id": chat_id}
@@ -385,24 +262,8 @@ async def test_upload_document_invalid_file_type(mock_sio, mock_graph, client):
 
 
 @pytest.mark.asyncio
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_list_documents(mock_sio, mock_graph, client):
+async def test_list_documents(client, chat_id):
     """Test listing documents for a conversation."""
-    mock_ai_message = AIMessage(content="Test")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
-
-    # Create conversation
-    create_res = await client.post(
-        "/api/v1/conversations/", json={"first_message": "List docs"}
-    )
-    chat_id = create_res.json()["id"]
-
     # List documents (should be empty initially)
     response = await client.get(f"/api/v1/documents/{chat_id}")
     assert response.status_code == 200
@@ -411,30 +272,15 @@ async def test_list_documents(mock_sio, mock_graph, client):
 
 
 @pytest.mark.asyncio
+@pytest.mark.slow
 @patch("app.api.v1.endpoints.documents.ingest_pdf_task.delay")
-@patch("app.api.v1.endpoints.chats.app_graph.ainvoke")
-@patch("app.api.v1.endpoints.chats.sio.emit_to_room")
-async def test_list_documents_after_upload(mock_sio, mock_graph, mock_celery, client):
+async def test_list_documents_after_upload(mock_celery, client, chat_id):
     """Test listing documents after upload."""
-    mock_ai_message = AIMessage(content="Test")
-    mock_graph.return_value = {
-        "messages": [mock_ai_message],
-        "context": "",
-        "has_documents": False,
-    }
-    mock_sio.return_value = None
     mock_celery.return_value = None
 
-    # Create conversation
-    create_res = await client.post(
-        "/api/v1/conversations/", json={"first_message": "Upload and list"}
-    )
-    chat_id = create_res.json()["id"]
-
     # Upload document
-    files = {"file": ("test.pdf", b"%PDF-1.4 fake pdf", "application/pdf")}
     data = {"conversation_id": chat_id}
-    await client.post("/api/v1/documents/", files=files, data=data)
+    await client.post("/api/v1/documents/", files=_PDF_FILES, data=data)
 
     # List documents
     response = await client.get(f"/api/v1/documents/{chat_id}")
@@ -1,6 +1,12 @@
 import asyncio
+import logging
+from uuid import UUID
+
 import socketio
 from celery import shared_task
+from celery.signals import worker_process_init, worker_process_shutdown
+from pgvector.asyncpg import register_vector
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
@@ -8,46 +14,127 @@ from sqlalchemy.ext.asyncio import (
 from app.core.config import settings
 from app.services.rag_service import rag_service
 
+logger = logging.getLogger(__name__)
+
+# One event loop + engine + sessionmaker per worker process, created after
+# the fork and reused across tasks. The old per-task engine paid a fresh
+# pool (TCP + TLS + auth handshake) for every single ingest; a shared pool
+# stays warm. asyncpg connections are bound to the loop they were opened
+# on, so the pool only survives across tasks if every task runs on the
+# same loop — hence the persistent loop instead of asyncio.run.
+_loop: asyncio.AbstractEventLoop | None = None
+_engine = None
+_Session = None
+
+
+def _create_engine():
+    engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL, pool_size=5, max_overflow=10
+    )
+
+    # Same binary pgvector codecs as the API engine — the worker is the one
+    # bulk-writing embeddings, so text-protocol binds hurt most here.
+    @event.listens_for(engine.sync_engine, "connect")
+    def _register_pgvector_codecs(dbapi_connection, connection_record):
+        try:
+            dbapi_connection.run_async(register_vector)
+        except ValueError:
+            # Extension not created yet (fresh database) — same guard as
+            # the API engine; the connection works over the text protocol.
+            pass
+
+    return engine
+
+
+@worker_process_init.connect
+def _init_worker(**kwargs):
+    global _loop, _engine, _Session
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _engine = _create_engine()
+    _Session = async_sessionmaker(bind=_engine, expire_on_commit=False)
+
+
+@worker_process_shutdown.connect
+def _shutdown_worker(**kwargs):
+    global _loop, _engine, _Session, _sio_mgr, _sio_server
+    if _loop is not None and not _loop.is_closed():
+        if _sio_mgr is not None:
+            try:
+                _loop.run_until_complete(_sio_mgr.redis.aclose())
+            except Exception:
+                pass
+        if _engine is not None:
+            _loop.run_until_complete(_engine.dispose())
+    _sio_mgr = _sio_server = None
+    if _loop is not None and not _loop.is_closed():
+        _loop.close()
+    _loop = _engine = _Session = None
+
+
+# Write-only Socket.IO emitter, shared across tasks. Built lazily on the
+# persistent worker loop (the Redis connection is loop-bound like the DB
+# pool) instead of per notify — the old code opened a fresh Redis
+# connection and built a manager + server object graph for every emit,
+# and leaked the manager afterwards.
+_sio_mgr: socketio.AsyncRedisManager | None = None
+_sio_server: socketio.AsyncServer | None = None
+
 
 # Helper to send notifications from a Worker
 async def notify_frontend(chat_id: str, data: dict):
     """
-    Creates a temporary, write-only connection to Redis to emit the event.
+    Emits the event over this worker's shared write-only Redis manager.
     This is safe to run inside the Worker's unique event loop.
     """
+    global _sio_mgr, _sio_server
     try:
-        # Connect to the SAME Redis that the API uses
-        mgr = socketio.AsyncRedisManager(settings.REDIS_URL, write_only=True)
-        tmp_server = socketio.AsyncServer(client_manager=mgr)
+        if _sio_server is None:
+            # Connect to the SAME Redis (and channel) that the API uses
+            from app.services.socketio_manager import SOCKETIO_CHANNEL
+
+            _sio_mgr = socketio.AsyncRedisManager(
+                settings.REDIS_URL, channel=SOCKETIO_CHANNEL, write_only=True
+            )
+            _sio_server = socketio.AsyncServer(client_manager=_sio_mgr)
 
         # Emit the event
-        await tmp_server.emit("doc_processed", data, room=chat_id)
+        await _sio_server.emit("doc_processed", data, room=chat_id)
+        logger.info("doc_processed emitted to %s", chat_id)
+    except Exception:
+        # logger.exception carries the traceback; no separate print needed
+        logger.exception("Notification failed")
 
-        # Clean up connection
-        # await mgr.close()
-    except Exception as e:
-        print(f"⚠️ Notification Failed: {e}")
 
+def _log_task_exc(task: asyncio.Task) -> None:
+    """Done-callback for fire-and-forget emits; never lets one die silently."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Notification task failed: %s", task.exception())
 
-async def run_ingest(doc_id, file_path, conversation_id):
-    # 1. Create a FRESH Engine & Session for this specific loop
-    # We cannot use the global 'engine' from core.database because it belongs to the wrong loop.
-    local_engine = create_async_engine(settings.ASYNC_DATABASE_URL)
-    LocalSession = async_sessionmaker(bind=local_engine, expire_on_commit=False)
 
+async def run_ingest(doc_id: UUID, file_path: str, conversation_id: UUID):
+    # Room names are the dashed str(uuid) the API joins clients under, so
+    # the notification keeps that format.
+    room = str(conversation_id)
+    notify_task = None
     try:
-        async with LocalSession() as session:
-            # 2. Pass this fresh session to the service
+        async with _Session() as session:
             stats = await rag_service.process_document(
                 doc_id, file_path, conversation_id, db=session
             )
 
-            # 3. Send Notification
-            await notify_frontend(str(conversation_id), stats)
+            # Send Notification — fire-and-forget. The client only needs
+            # the commit (already durable) to have happened; the Redis
+            # pub/sub round trip overlaps with session teardown instead of
+            # extending the task's critical path.
+            notify_task = asyncio.create_task(notify_frontend(room, stats))
+            notify_task.add_done_callback(_log_task_exc)
 
     finally:
-        # 4. Cleanup the engine
-        await local_engine.dispose()
+        if notify_task is not None:
+            # The shared loop only spins while a task coroutine is running;
+            # bounded wait so the emit lands before the loop goes idle.
+            await asyncio.wait({notify_task}, timeout=5)
 
 
 @shared_task(name="ingest_pdf")
@@ -55,9 +142,11 @@ def ingest_pdf_task(doc_id_str, file_path, conversation_id_str):
     """
     Wrapper to run async code in sync Celery worker.
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        loop.run_until_complete(run_ingest(doc_id_str, file_path, conversation_id_str))
-    finally:
-        loop.close()
+    if _loop is None:
+        # Pool types that skip worker_process_init (e.g. eager/solo) get
+        # the same lazy setup on first use.
+        _init_worker()
+    # Parse ids once at the boundary; everything below works with UUIDs.
+    return _loop.run_until_complete(
+        run_ingest(UUID(doc_id_str), file_path, UUID(conversation_id_str))
+    )